@@ -4,6 +4,7 @@
 import xml.etree.cElementTree as ET
 from collections import defaultdict
 import pprint
+from stream import get_source, open_source
 
 """
 Initial pass at the data set to confirm the following assumptions:
@@ -203,9 +204,11 @@ def audit_element(element):
 def main():
     global audit_report
     counter = 0
-    for _, element in ET.iterparse(DATA_FILE):
-        audit_element(element)
-        counter += 1
+    source, cache_file = get_source("Initial pass at the data set to confirm schema assumptions", DATA_FILE)
+    with open_source(source, cache_file) as data:
+        for _, element in ET.iterparse(data):
+            audit_element(element)
+            counter += 1
 
     pprint.pprint(audit_report)
     print "Total count: " + str(counter)
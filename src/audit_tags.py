@@ -4,6 +4,7 @@
 import xml.etree.cElementTree as ET
 import pprint
 import pandas as pd
+from stream import get_source, open_source
 
 DATA_FILE = 'crawley.osm'
 SUPPORTED_ELEMS = ['node', 'way', 'relation']
@@ -13,15 +14,17 @@ def main():
     Produces a report of all keys and values encountered by parent element and how often
     """
     tag_data = []
-    for _, element in ET.iterparse(DATA_FILE):
-        if element.tag in SUPPORTED_ELEMS:
-            for tag in [child for child in element if child.tag == 'tag']:
-                tag_data.append({
-                    'parent': element.tag,
-                    'parent_id': element.get('id'),
-                    'key': tag.get('k').encode('utf8'),
-                    'value': tag.get('v').encode('utf8')
-                })
+    source, cache_file = get_source("Report of all keys and values encountered", DATA_FILE)
+    with open_source(source, cache_file) as data:
+        for _, element in ET.iterparse(data):
+            if element.tag in SUPPORTED_ELEMS:
+                for tag in [child for child in element if child.tag == 'tag']:
+                    tag_data.append({
+                        'parent': element.tag,
+                        'parent_id': element.get('id'),
+                        'key': tag.get('k').encode('utf8'),
+                        'value': tag.get('v').encode('utf8')
+                    })
     # create a data frame of all key values
     tag_data_df = pd.DataFrame(tag_data)
 
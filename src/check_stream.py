@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import BaseHTTPServer
+import threading
+import urllib2
+import os
+import shutil
+import tempfile
+import time
+from stream import HTTPStream, ResumeError, CacheError
+
+"""
+Checks stream.py against a local stand-in for the Overpass API serving DATA_FILE.
+
+The stand-in server can drop the first connection partway through the body, with or
+without Range support, Content-Length and ETag, and can change the document between
+requests. For every scenario the bytes streamed and the cache file are compared with
+the original, or the expected error is checked.
+
+Run from the repository root: python src/check_stream.py
+"""
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'crawley.osm')
+DATA = open(DATA_FILE, 'rb').read()
+
+# name: (server options, expected error or None)
+SCENARIOS = [
+    ('complete download', {}, None),
+    ('complete download without Content-Length', {'length': False}, None),
+    ('dropped, resumed with Range', {'drop': True, 'etag': True, 'range': True}, None),
+    ('dropped, Range ignored, same ETag - skip forward', {'drop': True, 'etag': True}, None),
+    ('dropped, same Last-Modified - skip forward', {'drop': True, 'last_modified': True}, None),
+    ('dropped without Content-Length or validators', {'drop': True, 'length': False}, ResumeError),
+    ('dropped, document changed', {'drop': True, 'etag': True, 'range': True, 'changing': True}, ResumeError),
+    ('not found', {'status': 404}, urllib2.HTTPError),
+    # cache file on a full disk (Linux only), the download must not carry on without it
+    ('dropped, cache file can not be written', {'drop': True, 'etag': True, 'range': True, 'cache_full': True}, CacheError),
+]
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serves DATA according to the options of the server
+    """
+
+    def do_GET(self):
+        options = self.server.options
+        self.server.requests += 1
+        if options.get('status'):
+            self.send_error(options['status'])
+            return
+
+        etag = '"v' + str(self.server.requests if options.get('changing') else 1) + '"'
+        start = 0
+        if options.get('range') and self.headers.get('Range') and self.headers.get('If-Range') == etag:
+            start = int(self.headers.get('Range').split('=')[1].rstrip('-'))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes ' + str(start) + '-' + str(len(DATA) - 1) + '/' + str(len(DATA)))
+        else:
+            self.send_response(200)
+        body = DATA[start:]
+
+        if options.get('length', True):
+            self.send_header('Content-Length', str(len(body)))
+        if options.get('etag'):
+            self.send_header('ETag', etag)
+        if options.get('last_modified'):
+            self.send_header('Last-Modified', 'Sun, 18 Oct 2026 10:00:00 GMT')
+        self.end_headers()
+
+        # drop the first connection a third of the way into the body
+        if options.get('drop') and 1 == self.server.requests:
+            body = body[:len(body) // 3]
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def run_scenario(options, expected_error, cache_dir):
+    """
+    Stream DATA from a stand-in server with the given options
+    Returns a list of error messages
+    """
+    res = []
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.options = options
+    server.requests = 0
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    url = 'http://127.0.0.1:' + str(server.server_address[1]) + '/api/map'
+    cache_file = os.path.join(cache_dir, 'map.osm')
+    if options.get('cache_full'):
+        # every write to /dev/full fails with ENOSPC
+        os.symlink('/dev/full', cache_file + '.part')
+    try:
+        with HTTPStream(url, cache_file=cache_file, retry_delay=0) as data:
+            streamed = data.read()
+        if expected_error:
+            res.append("Expected " + expected_error.__name__ + ", download succeeded")
+        if streamed != DATA:
+            res.append("Streamed " + str(len(streamed)) + " bytes, not the original " + str(len(DATA)))
+        if not os.path.exists(cache_file) or open(cache_file, 'rb').read() != DATA:
+            res.append("Cache file does not match the original")
+    except Exception as e:
+        if not expected_error or not isinstance(e, expected_error):
+            res.append("Unexpected error: " + repr(e))
+        if os.path.exists(cache_file):
+            res.append("Cache file left after a failed download")
+        if 'status' in options and server.requests > 1:
+            res.append("Retried a " + str(options['status']) + " response")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    if os.path.exists(cache_file + '.part'):
+        res.append("Partial cache file left behind")
+    return res
+
+def check_bad_cache_path():
+    """
+    A cache file that can not be opened fails straight away in the caller
+    """
+    try:
+        HTTPStream('http://127.0.0.1:1/', cache_file='/nonexistent/dir/map.osm')
+    except IOError:
+        return []
+    return ["No error for a cache file that can not be opened"]
+
+def check_unknown_host():
+    """
+    An unknown host fails straight away instead of being retried
+    """
+    start = time.time()
+    try:
+        with HTTPStream('http://unknown-host.invalid/api/map', retry_delay=5) as data:
+            data.read()
+    except urllib2.URLError:
+        if time.time() - start > 4:
+            return ["Retried an unknown host"]
+        return []
+    return ["No error for an unknown host"]
+
+def check_read_after_close():
+    """
+    Reading a closed stream raises an error instead of blocking
+    """
+    data = HTTPStream('http://127.0.0.1:1/', retry_delay=30)
+    data.close()
+    try:
+        data.read()
+    except ValueError:
+        return []
+    return ["No error reading a closed stream"]
+
+def main():
+    failed = 0
+    cache_dir = tempfile.mkdtemp()
+    try:
+        for name, options, expected_error in SCENARIOS:
+            errors = run_scenario(options, expected_error, cache_dir)
+            for path in os.listdir(cache_dir):
+                os.remove(os.path.join(cache_dir, path))
+            print ("FAIL " if errors else "ok   ") + name
+            for error in errors:
+                print "     " + error
+            failed += bool(errors)
+
+        checks = [
+            ('cache file can not be opened', check_bad_cache_path),
+            ('unknown host', check_unknown_host),
+            ('read after close', check_read_after_close),
+        ]
+        for name, check in checks:
+            errors = check()
+            print ("FAIL " if errors else "ok   ") + name
+            for error in errors:
+                print "     " + error
+            failed += bool(errors)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    print str(len(SCENARIOS) + len(checks) - failed) + " passed, " + str(failed) + " failed"
+    if failed:
+        raise SystemExit(1)
+
+if "__main__" == __name__:
+    main()
@@ -6,6 +6,7 @@ import re
 import datetime
 import pprint
 import json
+from stream import get_source, open_source
 
 DATA_FILE = 'crawley.osm'
 SUPPORTED_ELEMS = ['node', 'way', 'relation']
@@ -387,11 +388,13 @@ def main():
     """
     elements = []
     elem_count = 0
-    for _, element in ET.iterparse(DATA_FILE):
-        if element.tag in SUPPORTED_ELEMS:
-            doc = shape_element(element)
-            elements.append(doc)
-            elem_count += 1
+    source, cache_file = get_source("Clean and shape the data set into a json file", DATA_FILE)
+    with open_source(source, cache_file) as data:
+        for _, element in ET.iterparse(data):
+            if element.tag in SUPPORTED_ELEMS:
+                doc = shape_element(element)
+                elements.append(doc)
+                elem_count += 1
 
     print "Total Elements cleaned and shaped: " + str(elem_count)
     
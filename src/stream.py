@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import urllib2
+import httplib
+import socket
+import sys
+import threading
+import Queue
+import re
+import os
+import argparse
+
+"""
+Streaming ingestion of the OpenStreetMap XML straight from the Overpass API.
+
+Instead of downloading the bbox export to disk first and then parsing it, a reader
+thread fetches the export over HTTP in chunks and pushes them into a bounded buffer.
+The parser (ET.iterparse) reads from the other end of the buffer, so download time
+and processing time overlap.
+
+- Transient errors (timeouts, dropped connections, truncated responses, HTTP 429 and
+  5xx) are retried with backoff, other errors (e.g. 404, unknown host, connection
+  refused, failing to write the cache file) fail straight away
+- Once data has been handed to the parser, the download can only be resumed if the
+  server proves it is still the same document: a 206 response to a Range + If-Range
+  request whose Content-Range starts at the last byte received, or a full 200 response
+  with the same ETag / Last-Modified (the bytes already received are then skipped).
+  Otherwise the download fails with a ResumeError rather than joining two different
+  documents together
+- Optionally the raw bytes are also written to a local cache file, so the export
+  can be re-used later without downloading it again. It is written to <cache>.part
+  and only renamed to <cache> once the whole download has been received. It is removed
+  when the download fails, but may be left behind if the process exits mid-download
+
+Limitations: the Overpass /api/map export is generated on the fly, so it is usually
+sent without Content-Length, ETag or Last-Modified. A connection closed cleanly midway
+is then only detected by the missing closing </osm> tag, and such a download can not
+be resumed - it fails with a ResumeError and has to be restarted.
+"""
+
+MAP_FILE = 'map.txt'
+CHUNK_SIZE = 64 * 1024 # bytes per read from the HTTP response
+BUFFER_CHUNKS = 16 # max chunks held in memory between the download and the parser
+MAX_RETRIES = 5
+RETRY_DELAY = 2 # seconds, doubled after every failed attempt
+TIMEOUT = 60 # seconds
+CLOSE_TIMEOUT = 5 # seconds to wait for the reader thread when closing
+END_TAG = '</osm>'
+
+URL = re.compile(r'https?://[^\s)]+')
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-')
+
+class ResumeError(Exception):
+    """
+    The download can not be resumed without mixing bytes from two different documents
+    """
+    pass
+
+class CacheError(Exception):
+    """
+    The downloaded bytes could not be written to the cache file
+    """
+    pass
+
+def get_map_url(map_file=MAP_FILE):
+    """
+    Read the Overpass download URL from the map description file
+    Returns the URL string
+    """
+    with open(map_file) as infile:
+        for line in infile:
+            if 'download' in line.lower():
+                url_present = URL.search(line)
+                if url_present:
+                    return url_present.group(0)
+    raise ValueError("No download URL found in " + map_file)
+
+def is_url(source):
+    """
+    Check if the data source is a HTTP(S) URL rather than a local file
+    """
+    return source.startswith('http://') or source.startswith('https://')
+
+def is_transient(error):
+    """
+    Check if retrying the download may help:
+    timeouts, dropped connections, truncated responses, HTTP 429 (too many requests) and 5xx
+    """
+    if isinstance(error, urllib2.HTTPError):
+        return 429 == error.code or error.code >= 500
+    if isinstance(error, urllib2.URLError):
+        # could not connect - only worth retrying if the connection timed out
+        # (unknown host, connection refused etc. will not fix themselves)
+        return isinstance(error.reason, socket.timeout)
+    # socket errors while reading and truncated responses are IOError / HTTPException
+    return isinstance(error, (IOError, httplib.HTTPException))
+
+class HTTPStream(object):
+    """
+    Read-only file-like object over a HTTP download
+
+    A reader thread fetches the response in chunks into a bounded queue,
+    read() hands these out to the parser as they arrive.
+    """
+
+    def __init__(self, url, cache_file=None, chunk_size=CHUNK_SIZE, buffer_chunks=BUFFER_CHUNKS,
+            max_retries=MAX_RETRIES, retry_delay=RETRY_DELAY, timeout=TIMEOUT):
+        self.url = url
+        self.cache_file = cache_file
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+
+        self.offset = 0 # bytes received so far, where to resume from
+        self._etag = None
+        self._last_modified = None
+        self._tail = '' # last bytes received, to check for the closing tag
+        self._chunks = Queue.Queue(maxsize=buffer_chunks)
+        self._pending = ''
+        self._done = False
+        self._stop = threading.Event()
+
+        # opened here so that a bad cache path fails in the caller
+        self._cache = open(cache_file + '.part', 'wb') if cache_file else None
+
+        self._reader = threading.Thread(target=self._download)
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _put(self, item):
+        """
+        Put an item into the buffer, giving up if the stream was closed
+        Returns False if the stream was closed
+        """
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return True
+            except Queue.Full:
+                pass
+        return False
+
+    def _open(self):
+        """
+        Open the HTTP response, resuming from the current offset
+        Returns the response and number of bytes to skip at its start
+        """
+        request = urllib2.Request(self.url)
+        validator = self._etag or self._last_modified
+        if self.offset:
+            if not validator:
+                raise ResumeError("Can not resume download of " + self.url + " at byte " + str(self.offset) +
+                    ": server sent no ETag or Last-Modified to check it is the same document")
+            request.add_header('Range', 'bytes=' + str(self.offset) + '-')
+            request.add_header('If-Range', validator)
+        response = urllib2.urlopen(request, timeout=self.timeout)
+        headers = response.info()
+
+        if not self.offset:
+            etag = headers.getheader('ETag')
+            # weak ETags can not be used in If-Range
+            if etag and not etag.startswith('W/'):
+                self._etag = etag
+            self._last_modified = headers.getheader('Last-Modified')
+            return response, 0
+
+        if 206 == response.getcode():
+            content_range = CONTENT_RANGE.match(headers.getheader('Content-Range') or '')
+            if not content_range or int(content_range.group(1)) != self.offset:
+                response.close()
+                raise ResumeError("Can not resume download of " + self.url + " at byte " + str(self.offset) +
+                    ": unexpected Content-Range " + str(headers.getheader('Content-Range')))
+            return response, 0
+
+        # full response - only the same document can be skipped forward
+        if (self._etag and self._etag == headers.getheader('ETag')) or \
+                (not self._etag and self._last_modified == headers.getheader('Last-Modified')):
+            return response, self.offset
+        response.close()
+        raise ResumeError("Can not resume download of " + self.url + " at byte " + str(self.offset) +
+            ": the document changed since the download started")
+
+    def _read_response(self, response, skip):
+        """
+        Push the response body into the buffer, skipping the first skip bytes
+        Returns True once the whole document was received, False if the stream was closed
+        """
+        expected = response.info().getheader('Content-Length')
+        received = 0
+        while not self._stop.is_set():
+            chunk = response.read(self.chunk_size)
+            if not chunk:
+                # connection dropped before the whole body was sent
+                if expected and received < int(expected):
+                    raise IOError("Connection closed after " + str(received) + " of " + expected + " bytes")
+                if not expected and not self._tail.rstrip().endswith(END_TAG):
+                    raise IOError("Connection closed after " + str(self.offset) + " bytes, before " + END_TAG)
+                return True
+            received += len(chunk)
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk = chunk[skip:]
+                skip = 0
+
+            if self._cache:
+                try:
+                    self._cache.write(chunk)
+                except (IOError, OSError) as e:
+                    raise CacheError("Can not write to cache file " + self.cache_file + ".part: " + str(e))
+            if not self._put(chunk):
+                return False
+            # only count the chunk once it is both cached and handed to the parser
+            self.offset += len(chunk)
+            self._tail = (self._tail + chunk)[-len(END_TAG) - 64:]
+        return False
+
+    def _download(self):
+        """
+        Reader thread - fetch the response in chunks and push into the buffer
+        Retries transient errors with resume, any other error is passed on to read()
+        """
+        complete = False
+        cached = False
+        try:
+            attempt = 0
+            delay = self.retry_delay
+            while not self._stop.is_set():
+                try:
+                    offset = self.offset
+                    response, skip = self._open()
+                    try:
+                        complete = self._read_response(response, skip)
+                    finally:
+                        response.close()
+                    break
+                except Exception as e:
+                    if self.offset > offset:
+                        attempt = 0
+                        delay = self.retry_delay
+                    attempt += 1
+                    if not is_transient(e) or attempt > self.max_retries:
+                        raise
+                    # not stdout, that is where the scripts print their reports
+                    print >> sys.stderr, "Download interrupted at byte " + str(self.offset) + ": " + str(e) + ", retrying in " + str(delay) + "s"
+                    self._stop.wait(delay)
+                    delay *= 2
+
+            if complete:
+                if self._cache:
+                    try:
+                        self._cache.close()
+                        os.rename(self.cache_file + '.part', self.cache_file)
+                    except (IOError, OSError) as e:
+                        raise CacheError("Can not save cache file " + self.cache_file + ": " + str(e))
+                    cached = True
+                self._put(None)
+        except Exception as e:
+            self._put(e)
+        finally:
+            # never leave a partial download at the cache path
+            if self._cache and not cached:
+                try:
+                    self._cache.close()
+                except (IOError, OSError):
+                    pass
+                if os.path.exists(self.cache_file + '.part'):
+                    os.remove(self.cache_file + '.part')
+
+    def read(self, size=-1):
+        """
+        Read up to size bytes, blocks until data is downloaded
+        Returns an empty string at the end of the download
+        """
+        while not self._done and (size < 0 or len(self._pending) < size):
+            if self._stop.is_set():
+                raise ValueError("I/O operation on closed stream")
+            try:
+                chunk = self._chunks.get(timeout=0.5)
+            except Queue.Empty:
+                continue
+            if chunk is None:
+                self._done = True
+            elif isinstance(chunk, Exception):
+                self._done = True
+                raise chunk
+            else:
+                self._pending += chunk
+
+        if size < 0:
+            size = len(self._pending)
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+    def close(self):
+        """
+        Stop the reader thread, waiting at most CLOSE_TIMEOUT for a blocked request
+        """
+        self._stop.set()
+        self._reader.join(CLOSE_TIMEOUT)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def open_source(source, cache_file=None):
+    """
+    Open the data source for ET.iterparse, use in a with statement
+    Returns a HTTPStream for URLs, otherwise the opened file
+    """
+    if is_url(source):
+        return HTTPStream(source, cache_file=cache_file)
+    return open(source, 'rb')
+
+def get_source(description, default):
+    """
+    Parse the command line for the data source shared by the scripts
+    Returns the data source (file path or URL) and the cache file path
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('source', nargs='?',
+        help="OSM XML file or URL to stream from (default: " + default + ")")
+    parser.add_argument('--map', action='store_true',
+        help="stream from the Overpass URL in " + MAP_FILE)
+    parser.add_argument('--cache',
+        help="also save the downloaded raw XML to this file")
+    args = parser.parse_args()
+
+    if args.map and args.source:
+        parser.error("--map can not be combined with a source")
+
+    source = args.source or default
+    if args.map:
+        source = get_map_url()
+    if args.cache and not is_url(source):
+        parser.error("--cache only applies when streaming from a URL")
+    return source, args.cache